@@ -6,13 +6,25 @@ Sets Docker-friendly defaults, then runs the main launcher logic.
 from __future__ import annotations
 
 import os
+import pathlib
+
+# Absolute paths resolved once by _set_default_env(). The env vars are
+# overwritten with these resolved strings, so colab_launcher's own resolve()
+# of DRIVE_ROOT/REPO_DIR is a no-op normalisation.
+_RESOLVED: dict[str, pathlib.Path] = {}
+
+
+def _resolve_env_path(name: str, alias: str, default: str) -> pathlib.Path:
+    path = pathlib.Path(os.environ.setdefault(name, default)).resolve()
+    os.environ[name] = str(path)
+    os.environ.setdefault(alias, str(path))
+    _RESOLVED[name] = path
+    return path
 
 
 def _set_default_env() -> None:
-    os.environ.setdefault("DRIVE_ROOT", "/data/Ouroboros")
-    os.environ.setdefault("REPO_DIR", "/data/ouroboros_repo")
-    os.environ.setdefault("OUROBOROS_DRIVE_ROOT", os.environ["DRIVE_ROOT"])
-    os.environ.setdefault("OUROBOROS_REPO_DIR", os.environ["REPO_DIR"])
+    _resolve_env_path("DRIVE_ROOT", "OUROBOROS_DRIVE_ROOT", "/data/Ouroboros")
+    _resolve_env_path("REPO_DIR", "OUROBOROS_REPO_DIR", "/data/ouroboros_repo")
 
     # In Docker dependencies must be preinstalled in the image.
     os.environ.setdefault("OUROBOROS_SKIP_RUNTIME_PIP", "1")
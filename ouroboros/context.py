@@ -191,8 +191,8 @@ def _build_health_invariants(env: Any) -> str:
 
     # 3. Per-task cost anomalies
     try:
-        from supervisor.state import per_task_cost_summary
-        costly = [t for t in per_task_cost_summary(5) if t["cost"] > 5.0]
+        from supervisor.costs import per_task_cost_summary
+        costly = [t for t in per_task_cost_summary(env.drive_path("logs/events.jsonl"), 5) if t["cost"] > 5.0]
         for t in costly:
             checks.append(
                 f"WARNING: HIGH-COST TASK — task_id={t['task_id']} "
@@ -7,6 +7,7 @@ Does not import anything from ouroboros.* (zero dependency level).
 
 from __future__ import annotations
 
+import atexit
 import datetime as _dt
 import hashlib
 import json
@@ -14,9 +15,15 @@ import logging
 import os
 import pathlib
 import subprocess
+import threading
 import time
 from typing import Any, Dict, List, Optional
 
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
 log = logging.getLogger(__name__)
 
 
@@ -36,6 +43,40 @@ def sha256_text(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
+# ---------------------------------------------------------------------------
+# JSON
+# ---------------------------------------------------------------------------
+
+def json_dumps_bytes(obj: Any, indent: bool = False, newline: bool = False) -> bytes:
+    """Encode obj as UTF-8 JSON, via orjson when available."""
+    if orjson is not None:
+        try:
+            option = orjson.OPT_NON_STR_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            if newline:
+                option |= orjson.OPT_APPEND_NEWLINE
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            # orjson rejects some values stdlib accepts (e.g. ints > 64 bit).
+            log.debug("orjson could not encode object, falling back to json", exc_info=True)
+    text = json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+    return (text + "\n" if newline else text).encode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    """Decode JSON from str/bytes/memoryview, via orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity, which stdlib json.dumps writes; let json decide.
+            pass
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
 # ---------------------------------------------------------------------------
 # File I/O
 # ---------------------------------------------------------------------------
@@ -49,11 +90,88 @@ def write_text(path: pathlib.Path, content: str) -> None:
     path.write_text(content, encoding="utf-8")
 
 
+# Append targets stay open for the life of the process (O_APPEND, so each
+# os.write() lands at the current end even across forked workers).
+_APPEND_FDS: Dict[str, int] = {}
+_APPEND_LOCK_PATHS: Dict[str, pathlib.Path] = {}
+_APPEND_HANDLES_LOCK = threading.Lock()
+
+
+def _append_fd(path: pathlib.Path) -> int:
+    key = str(path)
+    with _APPEND_HANDLES_LOCK:
+        fd = _APPEND_FDS.get(key)
+        if fd is not None:
+            try:
+                if os.fstat(fd).st_nlink > 0:
+                    return fd
+            except OSError:
+                pass
+            # File was deleted under us: reopen so lines don't go to an orphan inode.
+            _close_append_handle_unlocked(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(key, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_CLOEXEC", 0), 0o644)
+        _APPEND_FDS[key] = fd
+        return fd
+
+
+def _append_lock_path(path: pathlib.Path) -> pathlib.Path:
+    key = str(path)
+    lock_path = _APPEND_LOCK_PATHS.get(key)
+    if lock_path is None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path_hash = hashlib.sha256(str(path.resolve()).encode("utf-8")).hexdigest()[:12]
+        lock_path = path.parent / f".append_jsonl_{path_hash}.lock"
+        _APPEND_LOCK_PATHS[key] = lock_path
+    return lock_path
+
+
+def _close_append_handle_unlocked(key: str) -> None:
+    fd = _APPEND_FDS.pop(key, None)
+    if fd is not None:
+        try:
+            os.close(fd)
+        except OSError:
+            log.debug("Failed to close cached append fd for %s", key, exc_info=True)
+
+
+def flush_jsonl(path: pathlib.Path) -> None:
+    """fsync a JSONL file written via append_jsonl (explicit durability point)."""
+    with _APPEND_HANDLES_LOCK:
+        fd = _APPEND_FDS.get(str(path))
+    if fd is None:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        log.debug("Failed to fsync %s", path, exc_info=True)
+
+
+def _reset_append_lock_after_fork() -> None:
+    # Another thread may have held the lock at fork time; the child gets a fresh one.
+    global _APPEND_HANDLES_LOCK
+    _APPEND_HANDLES_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_append_lock_after_fork)
+
+
+@atexit.register
+def _close_append_handles() -> None:
+    with _APPEND_HANDLES_LOCK:
+        for key in list(_APPEND_FDS):
+            _close_append_handle_unlocked(key)
+
+
+def _jsonl_line(obj: Dict[str, Any]) -> bytes:
+    """Encode obj as one UTF-8 JSONL line, via orjson when available."""
+    return json_dumps_bytes(obj, newline=True)
+
+
 def append_jsonl(path: pathlib.Path, obj: Dict[str, Any]) -> None:
     """Append a JSON object as a line to a JSONL file (concurrent-safe)."""
-    path.parent.mkdir(parents=True, exist_ok=True)
-    line = json.dumps(obj, ensure_ascii=False)
-    data = (line + "\n").encode("utf-8")
+    data = _jsonl_line(obj)
 
     lock_timeout_sec = 2.0
     lock_stale_sec = 10.0
@@ -61,12 +179,11 @@ def append_jsonl(path: pathlib.Path, obj: Dict[str, Any]) -> None:
     write_retries = 3
     retry_sleep_base_sec = 0.01
 
-    path_hash = hashlib.sha256(str(path.resolve()).encode("utf-8")).hexdigest()[:12]
-    lock_path = path.parent / f".append_jsonl_{path_hash}.lock"
     lock_fd = None
     lock_acquired = False
 
     try:
+        lock_path = _append_lock_path(path)
         start = time.time()
         while time.time() - start < lock_timeout_sec:
             try:
@@ -89,20 +206,18 @@ def append_jsonl(path: pathlib.Path, obj: Dict[str, Any]) -> None:
 
         for attempt in range(write_retries):
             try:
-                fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
-                try:
-                    os.write(fd, data)
-                finally:
-                    os.close(fd)
+                os.write(_append_fd(path), data)
                 return
             except Exception:
+                with _APPEND_HANDLES_LOCK:
+                    _close_append_handle_unlocked(str(path))
                 if attempt < write_retries - 1:
                     time.sleep(retry_sleep_base_sec * (2 ** attempt))
 
         for attempt in range(write_retries):
             try:
-                with path.open("a", encoding="utf-8") as f:
-                    f.write(line + "\n")
+                with path.open("ab") as f:
+                    f.write(data)
                 return
             except Exception:
                 if attempt < write_retries - 1:
@@ -0,0 +1,160 @@
+"""
+Supervisor — Cost reports.
+
+Budget breakdowns by category, model and task, aggregated from the
+llm_usage events in logs/events.jsonl. Callers pass the events path, so
+this module does not depend on supervisor.state.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import pathlib
+from typing import Any, Dict, List
+
+log = logging.getLogger(__name__)
+
+
+def budget_breakdown(events_path: pathlib.Path) -> Dict[str, float]:
+    """
+    Calculate budget breakdown by category from events.jsonl.
+
+    Reads llm_usage events and aggregates cost_usd by category field.
+    Returns dict like {"task": 12.5, "evolution": 45.2, ...}
+    """
+    if not events_path.exists():
+        return {}
+
+    breakdown: Dict[str, float] = {}
+    try:
+        with events_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                    if event.get("type") != "llm_usage":
+                        continue
+
+                    # Get category (default to "other" if not present)
+                    category = event.get("category", "other")
+
+                    # Get cost from either top-level "cost" or nested "usage.cost"
+                    cost = 0.0
+                    if "cost" in event:
+                        cost = float(event.get("cost", 0))
+                    elif "usage" in event and isinstance(event["usage"], dict):
+                        cost = float(event["usage"].get("cost", 0))
+
+                    if cost > 0:
+                        breakdown[category] = breakdown.get(category, 0.0) + cost
+
+                except (json.JSONDecodeError, ValueError, TypeError):
+                    continue
+    except Exception:
+        log.warning("Failed to calculate budget breakdown", exc_info=True)
+
+    return breakdown
+
+
+def model_breakdown(events_path: pathlib.Path) -> Dict[str, Dict[str, float]]:
+    """
+    Calculate budget breakdown by model from events.jsonl.
+
+    Returns dict like:
+    {
+        "anthropic/claude-sonnet-4.6": {"cost": 12.5, "calls": 120, "prompt_tokens": 50000, "completion_tokens": 3000},
+        "openai/gpt-4o": {"cost": 3.2, "calls": 15, ...},
+    }
+    """
+    if not events_path.exists():
+        return {}
+
+    breakdown: Dict[str, Dict[str, float]] = {}
+    try:
+        with events_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                    if event.get("type") != "llm_usage":
+                        continue
+
+                    model = event.get("model") or "unknown"
+                    if not model:
+                        model = "unknown"
+
+                    # Get cost
+                    cost = 0.0
+                    if "cost" in event:
+                        cost = float(event.get("cost", 0))
+                    elif "usage" in event and isinstance(event["usage"], dict):
+                        cost = float(event["usage"].get("cost", 0))
+
+                    # Get tokens
+                    prompt_tokens = int(event.get("prompt_tokens", 0) or 0)
+                    completion_tokens = int(event.get("completion_tokens", 0) or 0)
+                    cached_tokens = int(event.get("cached_tokens", 0) or 0)
+
+                    if model not in breakdown:
+                        breakdown[model] = {"cost": 0.0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+                    breakdown[model]["cost"] += cost
+                    breakdown[model]["calls"] += 1
+                    breakdown[model]["prompt_tokens"] += prompt_tokens
+                    breakdown[model]["completion_tokens"] += completion_tokens
+                    breakdown[model]["cached_tokens"] += cached_tokens
+
+                except (json.JSONDecodeError, ValueError, TypeError):
+                    continue
+    except Exception:
+        log.warning("Failed to calculate model breakdown", exc_info=True)
+
+    return breakdown
+
+
+def per_task_cost_summary(events_path: pathlib.Path, max_tasks: int = 10,
+                          tail_bytes: int = 512_000) -> List[Dict[str, Any]]:
+    """Return cost summary for recent tasks from events.jsonl.
+
+    Only reads the last `tail_bytes` of the file to avoid scanning
+    megabytes of history on every LLM round.
+
+    Returns list of dicts: [{task_id, cost, rounds, model}, ...]
+    sorted by cost descending, limited to max_tasks.
+    """
+    if not events_path.exists():
+        return []
+
+    tasks: Dict[str, Dict[str, Any]] = {}
+    try:
+        file_size = events_path.stat().st_size
+        with events_path.open("r", encoding="utf-8") as f:
+            if file_size > tail_bytes:
+                f.seek(file_size - tail_bytes)
+                f.readline()  # skip partial first line
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                    if event.get("type") != "llm_usage":
+                        continue
+                    tid = event.get("task_id") or "unknown"
+                    cost = float(event.get("cost", 0) or 0)
+                    if tid not in tasks:
+                        tasks[tid] = {"task_id": tid, "cost": 0.0, "rounds": 0, "model": event.get("model", "")}
+                    tasks[tid]["cost"] += cost
+                    tasks[tid]["rounds"] += 1
+                except (json.JSONDecodeError, ValueError, TypeError):
+                    continue
+    except Exception:
+        log.warning("Failed to calculate per-task cost summary", exc_info=True)
+
+    sorted_tasks = sorted(tasks.values(), key=lambda x: x["cost"], reverse=True)
+    return sorted_tasks[:max_tasks]
@@ -18,7 +18,7 @@ import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
 from supervisor.state import (
-    load_state, save_state, append_jsonl, atomic_write_text,
+    update_state, append_jsonl, atomic_write_text,
 )
 
 log = logging.getLogger(__name__)
@@ -305,13 +305,11 @@ def checkout_and_reset(branch: str, reason: str = "unspecified",
     # Clean __pycache__ to prevent stale bytecode (git checkout may not update mtime)
     for p in REPO_DIR.rglob("__pycache__"):
         shutil.rmtree(p, ignore_errors=True)
-    st = load_state()
-    st["current_branch"] = branch
-    st["current_sha"] = subprocess.run(
+    sha = subprocess.run(
         ["git", "rev-parse", "HEAD"], cwd=str(REPO_DIR),
         capture_output=True, text=True, check=True,
     ).stdout.strip()
-    save_state(st)
+    update_state(current_branch=branch, current_sha=sha)
     return True, "ok"
 
 
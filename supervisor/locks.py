@@ -0,0 +1,220 @@
+"""
+Supervisor — File locks.
+
+Cross-process locks for state files: flock() on persistent lock files,
+with an O_EXCL lock-file fallback where fcntl is unavailable.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to O_EXCL lock files
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Callers on hot paths pass a pre-built str (no per-call str(Path)); both are accepted.
+LockPath = Union[str, pathlib.Path]
+
+
+# Lock files are opened once per process and never unlinked; flock() does the
+# cross-process exclusion. flock is owned by the open file description, so
+# threads sharing the cached fd are coordinated by an in-process
+# reader/writer lock on top, and the shared flock is held while any reader is.
+# The flock file is "<name>.flock", not the lock path itself: older code treats
+# an existing "<name>.lock" as held and unlinks it once stale, which would
+# stall it (or break exclusion) if it ran against a persistent file.
+class _LockState:
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.flock_mutex = threading.Lock()
+        self.shared_holders = 0
+
+
+_lock_states: Dict[str, _LockState] = {}
+_lock_registry_guard = threading.Lock()
+
+
+def _reset_lock_cache_after_fork() -> None:
+    """A forked child must not reuse the parent's lock fds (flock would see them as already held)."""
+    global _lock_registry_guard
+    for ls in _lock_states.values():
+        try:
+            os.close(ls.fd)
+        except OSError:
+            pass
+    _lock_states.clear()
+    _lock_registry_guard = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock_cache_after_fork)
+
+
+def _lock_state(lock_path: LockPath) -> _LockState:
+    key = os.fspath(lock_path)
+    with _lock_registry_guard:
+        ls = _lock_states.get(key)
+        if ls is None:
+            flock_path = pathlib.Path(key).with_suffix(".flock")
+            flock_path.parent.mkdir(parents=True, exist_ok=True)
+            ls = _LockState(os.open(str(flock_path), os.O_RDWR | os.O_CREAT, 0o644))
+            _lock_states[key] = ls
+        return ls
+
+
+def _flock_until(fd: int, op: int, deadline: float) -> bool:
+    # Threads in this process wait on the condition in _LockState; the short
+    # backoff below only applies to contention with another process.
+    # signal.alarm() cannot bound a blocking flock here because callers are
+    # not always the main thread.
+    delay = 0.001
+    while True:
+        try:
+            fcntl.flock(fd, op | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+
+def _acquire_flock(lock_path: LockPath, timeout_sec: float, shared: bool) -> Optional[int]:
+    try:
+        ls = _lock_state(lock_path)
+    except Exception:
+        log.warning(f"Failed to open lock file at {lock_path}", exc_info=True)
+        return None
+    deadline = time.monotonic() + timeout_sec
+    with ls.cond:
+        if not ls.cond.wait_for(lambda: not ls.writer and (shared or ls.readers == 0),
+                                timeout=max(0.0, timeout_sec)):
+            return None
+        if shared:
+            ls.readers += 1
+        else:
+            ls.writer = True
+    try:
+        if shared:
+            with ls.flock_mutex:
+                if ls.shared_holders == 0 and not _flock_until(ls.fd, fcntl.LOCK_SH, deadline):
+                    raise TimeoutError
+                ls.shared_holders += 1
+        elif not _flock_until(ls.fd, fcntl.LOCK_EX, deadline):
+            raise TimeoutError
+        return ls.fd
+    except TimeoutError:
+        pass
+    except Exception:
+        log.warning(f"Failed to acquire lock at {lock_path}", exc_info=True)
+    _release_rw(ls, shared)
+    return None
+
+
+def _release_rw(ls: _LockState, shared: bool) -> None:
+    with ls.cond:
+        if shared:
+            ls.readers -= 1
+        else:
+            ls.writer = False
+        ls.cond.notify_all()
+
+
+def acquire_file_lock(lock_path: LockPath, timeout_sec: float = 4.0,
+                      stale_sec: float = 90.0) -> Optional[int]:
+    """Take the lock exclusively. Returns an fd for release_file_lock, or None on timeout."""
+    if fcntl is None:
+        return _acquire_excl_lock(lock_path, timeout_sec, stale_sec)
+    return _acquire_flock(lock_path, timeout_sec, shared=False)
+
+
+def acquire_file_lock_shared(lock_path: LockPath, timeout_sec: float = 4.0,
+                             stale_sec: float = 90.0) -> Optional[int]:
+    """Take the lock shared with other readers; excludes exclusive holders."""
+    if fcntl is None:
+        return _acquire_excl_lock(lock_path, timeout_sec, stale_sec)
+    return _acquire_flock(lock_path, timeout_sec, shared=True)
+
+
+def release_file_lock(lock_path: LockPath, lock_fd: Optional[int]) -> None:
+    """Release a lock taken by acquire_file_lock or acquire_file_lock_shared."""
+    if lock_fd is None:
+        return
+    if fcntl is None:
+        _release_excl_lock(lock_path, lock_fd)
+        return
+    ls = _lock_states.get(os.fspath(lock_path))
+    if ls is None:
+        return
+    # While a writer holds the lock there can be no readers, so the mode is implied.
+    shared = not ls.writer
+    try:
+        if shared:
+            with ls.flock_mutex:
+                ls.shared_holders -= 1
+                if ls.shared_holders == 0:
+                    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        else:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    except Exception:
+        log.debug(f"Failed to unlock fd {lock_fd} for {lock_path}", exc_info=True)
+    _release_rw(ls, shared)
+
+
+def _acquire_excl_lock(lock_path: LockPath, timeout_sec: float, stale_sec: float) -> Optional[int]:
+    """O_EXCL lock-file fallback for platforms without fcntl."""
+    lock_path = pathlib.Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.time()
+    while (time.time() - started) < timeout_sec:
+        try:
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            try:
+                os.write(fd, f"pid={os.getpid()} ts={datetime.datetime.now(datetime.timezone.utc).isoformat()}\n".encode("utf-8"))
+            except Exception:
+                log.debug(f"Failed to write lock metadata to {lock_path}", exc_info=True)
+                pass
+            return fd
+        except FileExistsError:
+            try:
+                age = time.time() - lock_path.stat().st_mtime
+                if age > stale_sec:
+                    lock_path.unlink()
+                    continue
+            except Exception:
+                log.debug(f"Failed to check/remove stale lock at {lock_path}", exc_info=True)
+                pass
+            time.sleep(0.05)
+        except Exception:
+            log.warning(f"Failed to acquire lock at {lock_path}", exc_info=True)
+            break
+    return None
+
+
+def _release_excl_lock(lock_path: LockPath, lock_fd: int) -> None:
+    lock_path = pathlib.Path(lock_path)
+    try:
+        os.close(lock_fd)
+    except Exception:
+        log.debug(f"Failed to close lock fd {lock_fd} for {lock_path}", exc_info=True)
+        pass
+    try:
+        if lock_path.exists():
+            lock_path.unlink()
+    except Exception:
+        log.debug(f"Failed to unlink lock file {lock_path}", exc_info=True)
+        pass
@@ -16,8 +16,8 @@ import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
 from supervisor.state import (
-    load_state, save_state, append_jsonl, atomic_write_text,
-    QUEUE_SNAPSHOT_PATH, budget_pct, TOTAL_BUDGET_LIMIT,
+    load_state, save_state, append_jsonl, atomic_write_text, json_load_file,
+    get_config, budget_pct, TOTAL_BUDGET_LIMIT,
     budget_remaining, EVOLUTION_BUDGET_RESERVE,
 )
 from supervisor.telegram import send_with_budget
@@ -137,16 +137,17 @@ def persist_queue_snapshot(reason: str = "") -> None:
             },
         })
     running_rows = []
-    now = time.time()
     for task_id, meta in RUNNING.items():
         task = meta.get("task") if isinstance(meta, dict) else {}
         started = float(meta.get("started_at") or 0.0) if isinstance(meta, dict) else 0.0
         hb = float(meta.get("last_heartbeat_at") or 0.0) if isinstance(meta, dict) else 0.0
+        # Raw timestamps, not runtime/lag: derived values change every tick and
+        # would make every running row a patch entry (readers compute lags from ts).
         running_rows.append({
             "id": task_id, "type": task.get("type"), "priority": task.get("priority"),
             "attempt": meta.get("attempt"), "worker_id": meta.get("worker_id"),
-            "runtime_sec": round(max(0.0, now - started), 2) if started > 0 else 0.0,
-            "heartbeat_lag_sec": round(max(0.0, now - hb), 2) if hb > 0 else None,
+            "started_at": started or None,
+            "last_heartbeat_at": hb or None,
             "soft_sent": bool(meta.get("soft_sent")), "task": task,
         })
     payload = {
@@ -156,12 +157,109 @@ def persist_queue_snapshot(reason: str = "") -> None:
         "pending": pending_rows, "running": running_rows,
     }
     try:
-        atomic_write_text(QUEUE_SNAPSHOT_PATH, json.dumps(payload, ensure_ascii=False, indent=2))
+        _write_queue_snapshot(payload)
     except Exception:
         log.warning("Failed to persist queue snapshot (reason=%s)", reason, exc_info=True)
         pass
 
 
+# ---------------------------------------------------------------------------
+# Queue snapshot patches
+# ---------------------------------------------------------------------------
+# persist_queue_snapshot runs on every main-loop tick. Instead of rewriting
+# the whole snapshot each time, only the difference from the previous save
+# is appended to queue_snapshot.patch.jsonl. The full snapshot is rewritten on
+# the first save of each process and every QUEUE_SNAPSHOT_COMPACT_EVERY
+# patches. Each full snapshot gets a fresh "gen" and patches carry it, so
+# patches left over from an older snapshot are never replayed onto a newer one.
+QUEUE_SNAPSHOT_COMPACT_EVERY: int = 100
+_SNAPSHOT_ROW_KEYS = ("pending", "running")
+_snapshot_lock = threading.Lock()
+_snapshot_base: Optional[Dict[str, Any]] = None
+_snapshot_patches: int = 0
+
+
+def _diff_snapshot_rows(prev: List[Dict[str, Any]], curr: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rows that changed ("put") plus the new id order if it differs (drops are implied by it)."""
+    prev_by_id = {r.get("id"): r for r in prev}
+    diff: Dict[str, Any] = {}
+    put = [r for r in curr if prev_by_id.get(r.get("id")) != r]
+    if put:
+        diff["put"] = put
+    order = [r.get("id") for r in curr]
+    if order != [r.get("id") for r in prev]:
+        diff["order"] = order
+    return diff
+
+
+def save_queue_snapshot_delta(prev: Dict[str, Any], curr: Dict[str, Any]) -> Dict[str, Any]:
+    """Append the patch turning snapshot prev into curr to the patch log; returns the patch."""
+    patch: Dict[str, Any] = {"gen": prev.get("gen")}
+    changed = {k: v for k, v in curr.items()
+               if k not in _SNAPSHOT_ROW_KEYS and k != "gen" and prev.get(k) != v}
+    if changed:
+        patch["set"] = changed
+    for key in _SNAPSHOT_ROW_KEYS:
+        diff = _diff_snapshot_rows(prev.get(key) or [], curr.get(key) or [])
+        if diff:
+            patch[key] = diff
+    append_jsonl(get_config().queue_snapshot_patch_path, patch)
+    return patch
+
+
+def _apply_snapshot_patch(snap: Dict[str, Any], patch: Dict[str, Any]) -> None:
+    snap.update(patch.get("set") or {})
+    for key in _SNAPSHOT_ROW_KEYS:
+        diff = patch.get(key)
+        if not isinstance(diff, dict):
+            continue
+        base_rows = snap.get(key) or []
+        rows = {r.get("id"): r for r in base_rows}
+        for r in diff.get("put") or []:
+            rows[r.get("id")] = r
+        order = diff.get("order", [r.get("id") for r in base_rows])
+        snap[key] = [rows[i] for i in order if i in rows]
+
+
+def _write_queue_snapshot(payload: Dict[str, Any]) -> None:
+    global _snapshot_base, _snapshot_patches
+    with _snapshot_lock:
+        if _snapshot_base is not None and _snapshot_patches < QUEUE_SNAPSHOT_COMPACT_EVERY:
+            save_queue_snapshot_delta(_snapshot_base, payload)
+            _snapshot_base = dict(payload, gen=_snapshot_base.get("gen"))
+            _snapshot_patches += 1
+            return
+        cfg = get_config()
+        base = dict(payload, gen=uuid.uuid4().hex[:12])
+        atomic_write_text(cfg.queue_snapshot_path, json.dumps(base, ensure_ascii=False, indent=2))
+        # Old patches no longer match the new gen; truncate to keep the log bounded.
+        patch_path = cfg.queue_snapshot_patch_path
+        if patch_path.exists() and patch_path.stat().st_size:
+            patch_path.write_bytes(b"")
+        _snapshot_base = base
+        _snapshot_patches = 0
+
+
+def load_queue_snapshot() -> Optional[Dict[str, Any]]:
+    """Read the full queue snapshot and replay its patches on top of it."""
+    cfg = get_config()
+    snap = json_load_file(cfg.queue_snapshot_path)
+    if snap is None:
+        return None
+    try:
+        with cfg.queue_snapshot_patch_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    patch = json.loads(line)
+                except ValueError:
+                    continue  # torn trailing line from a crash mid-append
+                if isinstance(patch, dict) and patch.get("gen") == snap.get("gen"):
+                    _apply_snapshot_patch(snap, patch)
+    except FileNotFoundError:
+        pass
+    return snap
+
+
 def parse_iso_to_ts(iso_ts: str) -> Optional[float]:
     """Parse ISO timestamp to Unix timestamp."""
     txt = str(iso_ts or "").strip()
@@ -179,10 +277,8 @@ def restore_pending_from_snapshot(max_age_sec: int = 900) -> int:
     if PENDING:
         return 0
     try:
-        if not QUEUE_SNAPSHOT_PATH.exists():
-            return 0
-        snap = json.loads(QUEUE_SNAPSHOT_PATH.read_text(encoding="utf-8"))
-        if not isinstance(snap, dict):
+        snap = load_queue_snapshot()
+        if snap is None:
             return 0
         ts = str(snap.get("ts") or "")
         ts_unix = parse_iso_to_ts(ts)
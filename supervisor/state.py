@@ -1,154 +1,255 @@
 """
 Supervisor — State management.
 
-Persistent state on Google Drive: load, save, atomic writes, file locks.
+Persistent state on Google Drive: load, save, atomic writes.
+File locks live in supervisor.locks and are re-exported here.
 """
 
 from __future__ import annotations
 
+import atexit
+import contextlib
 import datetime
+import errno
+import hashlib
 import json
 import logging
+import mmap
 import os
 import pathlib
+import threading
 import time
 import uuid
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# JSON codecs live in ouroboros.utils (single source of truth); orjson is
+# None there when it is not installed.
+from ouroboros.utils import json_dumps_bytes, json_loads, orjson
+from supervisor.costs import budget_breakdown, model_breakdown
 
 log = logging.getLogger(__name__)
 
 
 # ---------------------------------------------------------------------------
-# Module-level config (set via init())
+# Config (set once via init())
 # ---------------------------------------------------------------------------
-DRIVE_ROOT: pathlib.Path = pathlib.Path("/content/drive/MyDrive/Ouroboros")
-STATE_PATH: pathlib.Path = DRIVE_ROOT / "state" / "state.json"
-STATE_LAST_GOOD_PATH: pathlib.Path = DRIVE_ROOT / "state" / "state.last_good.json"
-STATE_LOCK_PATH: pathlib.Path = DRIVE_ROOT / "locks" / "state.lock"
-QUEUE_SNAPSHOT_PATH: pathlib.Path = DRIVE_ROOT / "state" / "queue_snapshot.json"
+@dataclass(frozen=True, slots=True)
+class StateConfig:
+    """Resolved state file locations, with str forms pre-built for os.* calls."""
+    drive_root: pathlib.Path
+    state_path: pathlib.Path
+    state_path_str: str
+    last_good_path: pathlib.Path
+    last_good_path_str: str
+    lock_path: pathlib.Path
+    lock_path_str: str
+    delta_path: pathlib.Path
+    delta_path_str: str
+    queue_snapshot_path: pathlib.Path
+    queue_snapshot_patch_path: pathlib.Path
+
+    @classmethod
+    def for_root(cls, drive_root: pathlib.Path) -> "StateConfig":
+        state_dir = drive_root / "state"
+        state_path = state_dir / "state.json"
+        last_good_path = state_dir / "state.last_good.json"
+        delta_path = state_dir / "state.delta.jsonl"
+        lock_path = drive_root / "locks" / "state.lock"
+        return cls(
+            drive_root=drive_root,
+            state_path=state_path,
+            state_path_str=str(state_path),
+            last_good_path=last_good_path,
+            last_good_path_str=str(last_good_path),
+            lock_path=lock_path,
+            lock_path_str=str(lock_path),
+            delta_path=delta_path,
+            delta_path_str=str(delta_path),
+            queue_snapshot_path=state_dir / "queue_snapshot.json",
+            queue_snapshot_patch_path=state_dir / "queue_snapshot.patch.jsonl",
+        )
+
+
+_CFG: StateConfig = StateConfig.for_root(pathlib.Path("/content/drive/MyDrive/Ouroboros"))
 
 
 def init(drive_root: pathlib.Path, total_budget_limit: float = 0.0) -> None:
-    global DRIVE_ROOT, STATE_PATH, STATE_LAST_GOOD_PATH, STATE_LOCK_PATH, QUEUE_SNAPSHOT_PATH
-    DRIVE_ROOT = drive_root
-    STATE_PATH = drive_root / "state" / "state.json"
-    STATE_LAST_GOOD_PATH = drive_root / "state" / "state.last_good.json"
-    STATE_LOCK_PATH = drive_root / "locks" / "state.lock"
-    QUEUE_SNAPSHOT_PATH = drive_root / "state" / "queue_snapshot.json"
+    global _CFG
+    _CFG = StateConfig.for_root(drive_root)
+    _forget_disk_state()
     set_budget_limit(total_budget_limit)
 
 
+def get_config() -> StateConfig:
+    """The StateConfig installed by the last init(); read it at call time, not import time."""
+    return _CFG
+
+
 # ---------------------------------------------------------------------------
 # Atomic file operations
 # ---------------------------------------------------------------------------
+# fsync is very slow on network/overlay volumes (Drive, Docker); the atomic
+# rename alone keeps state.json consistent, so full fsync is opt-in.
+_DURABLE: bool = os.environ.get("OUROBOROS_STATE_DURABLE", "0") == "1"
+# O_DSYNC makes each write durable for the file's data only, which is all a
+# temp file needs before its rename; 0 where unsupported (explicit fsync then).
+_O_DSYNC: int = getattr(os, "O_DSYNC", 0)
 
-def atomic_write_text(path: pathlib.Path, content: str) -> None:
+
+def _fsync(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # Some mounts (e.g. SMB, FUSE) reject fsync outright; the write itself succeeded.
+        if e.errno not in (errno.EINVAL, errno.ENOTSUP):
+            raise
+
+
+def _atomic_write_bytes(path: pathlib.Path, data: bytes, fsync: bool = True) -> pathlib.Path:
+    """Write data to a temp file next to path and return the temp path.
+
+    The caller is responsible for os.replace()-ing the temp file onto its
+    final destination; this lets one encoded payload be renamed and then
+    mirrored without a second encode/fsync.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_name(f".{path.name}.tmp.{uuid.uuid4().hex}")
-    fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    # pid+thread is unique among concurrent writers (atomic_write_text is also
+    # used outside STATE_LOCK); O_TRUNC reclaims a temp left by a crashed run.
+    tmp = path.with_name(f".{path.name}.tmp.{os.getpid()}.{threading.get_ident()}")
+    durable = fsync and _DURABLE
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | (_O_DSYNC if durable else 0)
+    fd = os.open(str(tmp), flags, 0o644)
     try:
-        data = content.encode("utf-8")
         os.write(fd, data)
-        os.fsync(fd)
+        if durable and not _O_DSYNC:
+            _fsync(fd)
     finally:
         os.close(fd)
-    os.replace(str(tmp), str(path))
+    return tmp
 
 
-def json_load_file(path: pathlib.Path) -> Optional[Dict[str, Any]]:
-    try:
-        if not path.exists():
-            return None
-        obj = json.loads(path.read_text(encoding="utf-8"))
-        return obj if isinstance(obj, dict) else None
-    except Exception:
-        log.debug(f"Failed to load JSON from {path}", exc_info=True)
-        return None
+def atomic_write_text(path: pathlib.Path, content: str) -> None:
+    tmp = _atomic_write_bytes(path, content.encode("utf-8"))
+    os.replace(str(tmp), str(path))
 
 
-# ---------------------------------------------------------------------------
-# File locks
-# ---------------------------------------------------------------------------
+# Below this size a plain read() is cheaper than setting up a mapping.
+_MMAP_MIN_BYTES: int = 4096
 
-def acquire_file_lock(lock_path: pathlib.Path, timeout_sec: float = 4.0,
-                      stale_sec: float = 90.0) -> Optional[int]:
-    lock_path.parent.mkdir(parents=True, exist_ok=True)
-    started = time.time()
-    while (time.time() - started) < timeout_sec:
-        try:
-            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
-            try:
-                os.write(fd, f"pid={os.getpid()} ts={datetime.datetime.now(datetime.timezone.utc).isoformat()}\n".encode("utf-8"))
-            except Exception:
-                log.debug(f"Failed to write lock metadata to {lock_path}", exc_info=True)
-                pass
-            return fd
-        except FileExistsError:
-            try:
-                age = time.time() - lock_path.stat().st_mtime
-                if age > stale_sec:
-                    lock_path.unlink()
-                    continue
-            except Exception:
-                log.debug(f"Failed to check/remove stale lock at {lock_path}", exc_info=True)
-                pass
-            time.sleep(0.05)
-        except Exception:
-            log.warning(f"Failed to acquire lock at {lock_path}", exc_info=True)
-            break
-    return None
 
+def _json_load_file_digest(path: pathlib.Path, digest: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[bytes]]:
+    """Load a JSON object from path; returns (obj, payload hash if digest else None).
 
-def release_file_lock(lock_path: pathlib.Path, lock_fd: Optional[int]) -> None:
-    if lock_fd is None:
-        return
-    try:
-        os.close(lock_fd)
-    except Exception:
-        log.debug(f"Failed to close lock fd {lock_fd} for {lock_path}", exc_info=True)
-        pass
+    With orjson, files of _MMAP_MIN_BYTES or more are parsed straight from
+    a read-only mmap instead of being copied into a bytes object first.
+    """
     try:
-        if lock_path.exists():
-            lock_path.unlink()
+        with path.open("rb") as f:
+            mm = None
+            if orjson is not None and os.fstat(f.fileno()).st_size >= _MMAP_MIN_BYTES:
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    # Some mounts (FUSE, Drive) cannot be mapped; a plain read still works.
+                    log.debug(f"mmap unavailable for {path}, reading instead", exc_info=True)
+            if mm is not None:
+                with mm, memoryview(mm) as view:
+                    obj = json_loads(view)
+                    h = _payload_hash(view) if digest else None
+            else:
+                raw = f.read()
+                obj = json_loads(raw)
+                h = _payload_hash(raw) if digest else None
+        return (obj, h) if isinstance(obj, dict) else (None, None)
+    except FileNotFoundError:
+        return None, None
     except Exception:
-        log.debug(f"Failed to unlink lock file {lock_path}", exc_info=True)
-        pass
+        log.debug(f"Failed to load JSON from {path}", exc_info=True)
+        return None, None
+
 
+def json_load_file(path: pathlib.Path) -> Optional[Dict[str, Any]]:
+    return _json_load_file_digest(path)[0]
+
+
+# Re-export file locks from supervisor.locks (single source of truth)
+from supervisor.locks import (  # noqa: F401
+    acquire_file_lock, acquire_file_lock_shared, release_file_lock,
+)
 
 # Re-export append_jsonl from ouroboros.utils (single source of truth)
 from ouroboros.utils import append_jsonl  # noqa: F401
 
 
+# ---------------------------------------------------------------------------
+# Timestamps
+# ---------------------------------------------------------------------------
+# (epoch second, ISO string) for the last second formatted; state timestamps
+# only need second resolution, so formatting once per second is enough.
+_now_iso_cache: Tuple[int, str] = (0, "")
+
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO-8601 string, truncated to the second."""
+    global _now_iso_cache
+    sec = int(time.time())
+    cached = _now_iso_cache
+    if sec != cached[0]:
+        cached = (sec, datetime.datetime.fromtimestamp(sec, datetime.timezone.utc).isoformat())
+        _now_iso_cache = cached
+    return cached[1]
+
+
 # ---------------------------------------------------------------------------
 # State schema
 # ---------------------------------------------------------------------------
 
+# Bump when ensure_state_defaults gains/drops keys so stored states re-migrate.
+_STATE_SCHEMA_VERSION = 2
+
+
+# (key, default) pairs. Callable defaults are per-state values (timestamps,
+# ids) and are only materialized when the key is actually missing.
+_DEFAULT_ITEMS: Tuple[Tuple[str, Any], ...] = (
+    ("created_at", _now_iso),
+    ("owner_id", None),
+    ("owner_chat_id", None),
+    ("tg_offset", 0),
+    ("spent_usd", 0.0),
+    ("spent_calls", 0),
+    ("spent_tokens_prompt", 0),
+    ("spent_tokens_completion", 0),
+    ("spent_tokens_cached", 0),
+    ("session_id", lambda: uuid.uuid4().hex),
+    ("current_branch", None),
+    ("current_sha", None),
+    ("last_owner_message_at", ""),
+    ("last_evolution_task_at", ""),
+    ("budget_messages_since_report", 0),
+    ("evolution_mode_enabled", False),
+    ("evolution_cycle", 0),
+    ("session_total_snapshot", None),
+    ("session_spent_snapshot", None),
+    ("budget_drift_pct", None),
+    ("budget_drift_alert", False),
+    ("evolution_consecutive_failures", 0),
+)
+_LEGACY_KEYS = frozenset((
+    "approvals", "idle_cursor", "idle_stats", "last_idle_task_at",
+    "last_auto_review_at", "last_review_task_id", "session_daily_snapshot",
+))
+
+
 def ensure_state_defaults(st: Dict[str, Any]) -> Dict[str, Any]:
-    st.setdefault("created_at", datetime.datetime.now(datetime.timezone.utc).isoformat())
-    st.setdefault("owner_id", None)
-    st.setdefault("owner_chat_id", None)
-    st.setdefault("tg_offset", 0)
-    st.setdefault("spent_usd", 0.0)
-    st.setdefault("spent_calls", 0)
-    st.setdefault("spent_tokens_prompt", 0)
-    st.setdefault("spent_tokens_completion", 0)
-    st.setdefault("spent_tokens_cached", 0)
-    st.setdefault("session_id", uuid.uuid4().hex)
-    st.setdefault("current_branch", None)
-    st.setdefault("current_sha", None)
-    st.setdefault("last_owner_message_at", "")
-    st.setdefault("last_evolution_task_at", "")
-    st.setdefault("budget_messages_since_report", 0)
-    st.setdefault("evolution_mode_enabled", False)
-    st.setdefault("evolution_cycle", 0)
-    st.setdefault("session_total_snapshot", None)
-    st.setdefault("session_spent_snapshot", None)
-    st.setdefault("budget_drift_pct", None)
-    st.setdefault("budget_drift_alert", False)
-    st.setdefault("evolution_consecutive_failures", 0)
-    for legacy_key in ("approvals", "idle_cursor", "idle_stats", "last_idle_task_at",
-                        "last_auto_review_at", "last_review_task_id", "session_daily_snapshot"):
+    if st.get("__schema_v") == _STATE_SCHEMA_VERSION:
+        return st
+    for key, default in _DEFAULT_ITEMS:
+        if key not in st:
+            st[key] = default() if callable(default) else default
+    for legacy_key in _LEGACY_KEYS:
         st.pop(legacy_key, None)
+    st["__schema_v"] = _STATE_SCHEMA_VERSION
     return st
 
 
@@ -161,47 +262,335 @@ def default_state_dict() -> Dict[str, Any]:
 # Load / Save
 # ---------------------------------------------------------------------------
 
-def _load_state_unlocked() -> Dict[str, Any]:
-    """Load state without acquiring lock. Caller must hold STATE_LOCK."""
+# Digest of the state.json bytes as last read or written by this process.
+# A save whose payload matches it would rewrite identical bytes, so it is skipped.
+_LAST_PAYLOAD_HASH: Optional[bytes] = None
+
+
+def _forget_disk_state() -> None:
+    """Drop what this process assumes about the files on disk (paths changed)."""
+    global _LAST_PAYLOAD_HASH
+    _LAST_PAYLOAD_HASH = None
+
+
+def _payload_hash(payload: bytes) -> bytes:
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _read_state_unlocked() -> Tuple[Dict[str, Any], Optional[str]]:
+    """Read state without writing. Caller must hold STATE_LOCK (shared is enough).
+
+    Returns (state, repair): repair is None when the files on disk are
+    already current, "primary" when only state.json needs rewriting from the
+    last_good copy, or "full" when both files must be saved.
+    """
+    global _LAST_PAYLOAD_HASH
     recovered = False
-    st_obj = json_load_file(STATE_PATH)
+    st_obj, _LAST_PAYLOAD_HASH = _json_load_file_digest(_CFG.state_path, digest=True)
     if st_obj is None:
-        st_obj = json_load_file(STATE_LAST_GOOD_PATH)
+        st_obj = json_load_file(_CFG.last_good_path)
         recovered = st_obj is not None
 
     if st_obj is None:
-        st = ensure_state_defaults(default_state_dict())
-        _save_state_unlocked(st)
-        return st
+        st = default_state_dict()
+        _replay_state_deltas(st)
+        return st, "full"
 
+    migrated = st_obj.get("__schema_v") != _STATE_SCHEMA_VERSION
     st = ensure_state_defaults(st_obj)
+    replayed = _replay_state_deltas(st)
+    if migrated or (recovered and replayed):
+        return st, "full"
     if recovered:
-        _save_state_unlocked(st)
-    return st
+        # last_good already holds this exact state; only the primary needs repair.
+        return st, "primary"
+    return st, None
+
+
+def _load_state_unlocked() -> Dict[str, Any]:
+    """Load state, repairing files on disk if needed. Caller must hold STATE_LOCK exclusively."""
+    st, repair = _read_state_unlocked()
+    if repair == "full":
+        _save_state_unlocked(st, _validated=True)
+    elif repair == "primary":
+        payload = json_dumps_bytes(st, indent=True)
+        _write_state_primary(payload, _payload_hash(payload))
+    return _overlay_dirty_state(st)
 
 
-def _save_state_unlocked(st: Dict[str, Any]) -> None:
-    """Save state without acquiring lock. Caller must hold STATE_LOCK."""
-    st = ensure_state_defaults(st)
-    payload = json.dumps(st, ensure_ascii=False, indent=2)
-    atomic_write_text(STATE_PATH, payload)
-    atomic_write_text(STATE_LAST_GOOD_PATH, payload)
+def _write_state_primary(payload: bytes, digest: bytes) -> None:
+    global _LAST_PAYLOAD_HASH
+    tmp = _atomic_write_bytes(_CFG.state_path, payload)
+    os.replace(str(tmp), _CFG.state_path_str)
+    _LAST_PAYLOAD_HASH = digest
+
+
+def _save_state_unlocked(st: Dict[str, Any], _validated: bool = False) -> None:
+    """Save state without acquiring lock. Caller must hold STATE_LOCK.
+
+    Pass _validated=True when st has just been through ensure_state_defaults.
+    """
+    if not _validated:
+        st = ensure_state_defaults(st)
+    _absorb_dirty_state(st)
+    payload = json_dumps_bytes(st, indent=True)
+    digest = _payload_hash(payload)
+    if digest != _LAST_PAYLOAD_HASH:
+        _write_state_primary(payload, digest)
+        _mirror_last_good(payload)
+    _truncate_state_deltas()
+
+
+def _mirror_last_good(payload: bytes) -> None:
+    """Mirror the already-encoded payload to the last_good path.
+
+    Only the primary write is fsynced (when OUROBOROS_STATE_DURABLE=1); the
+    mirror never is.
+    It is deliberately a separate inode (not a hard link): an in-place write
+    to state.json must never be able to corrupt the backup as well.
+    """
+    tmp = _atomic_write_bytes(_CFG.last_good_path, payload, fsync=False)
+    os.replace(str(tmp), _CFG.last_good_path_str)
 
 
 def load_state() -> Dict[str, Any]:
-    lock_fd = acquire_file_lock(STATE_LOCK_PATH)
+    lock_fd = acquire_file_lock_shared(_CFG.lock_path_str)
+    try:
+        st, repair = _read_state_unlocked()
+    finally:
+        release_file_lock(_CFG.lock_path_str, lock_fd)
+    if repair is None:
+        return _overlay_dirty_state(st)
+    # Repair needs the exclusive lock; re-read under it since a writer may have won the race.
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
     try:
         return _load_state_unlocked()
     finally:
-        release_file_lock(STATE_LOCK_PATH, lock_fd)
+        release_file_lock(_CFG.lock_path_str, lock_fd)
+
+
+def save_state(st: Dict[str, Any], _validated: bool = False) -> None:
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
+    try:
+        _save_state_unlocked(st, _validated=_validated)
+    finally:
+        release_file_lock(_CFG.lock_path_str, lock_fd)
 
 
-def save_state(st: Dict[str, Any]) -> None:
-    lock_fd = acquire_file_lock(STATE_LOCK_PATH)
+@contextlib.contextmanager
+def transaction() -> Iterator[Dict[str, Any]]:
+    """Read-modify-write state under one exclusive lock.
+
+        with transaction() as st:
+            st["a"] = 1
+            st["b"] = 2
+
+    The state is saved once when the block exits normally; if the block
+    raises, nothing is written.
+    """
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
     try:
+        st = _load_state_unlocked()
+        yield st
         _save_state_unlocked(st)
     finally:
-        release_file_lock(STATE_LOCK_PATH, lock_fd)
+        release_file_lock(_CFG.lock_path_str, lock_fd)
+
+
+def update_state(**patches: Any) -> Dict[str, Any]:
+    """Set several top-level keys in one locked load/save. Returns the saved state."""
+    with transaction() as st:
+        st.update(patches)
+    return st
+
+
+# ---------------------------------------------------------------------------
+# Write-back cache for low-value fields
+# ---------------------------------------------------------------------------
+# Fields staged with mark_dirty() are held in memory and written by the next
+# flush_state() call that is due, instead of costing a full save each.
+# load_state() overlays them so readers in this process never see stale
+# values. Only the staged keys are written on flush, so a flush cannot
+# clobber counters other code saved in the meantime.
+STATE_FLUSH_INTERVAL_SEC: float = 5.0
+_dirty_state: Dict[str, Any] = {}
+_dirty_guard = threading.Lock()
+_last_flush: float = 0.0
+
+
+def mark_dirty(key: str, value: Any) -> None:
+    """Stage a top-level state update for the next flush_state()."""
+    with _dirty_guard:
+        _dirty_state[key] = value
+
+
+def _overlay_dirty_state(st: Dict[str, Any]) -> Dict[str, Any]:
+    with _dirty_guard:
+        st.update(_dirty_state)
+    return st
+
+
+def _absorb_dirty_state(st: Dict[str, Any]) -> None:
+    """Drop staged keys that a full save of st is about to persist anyway.
+
+    Only exact matches are dropped: a value staged after st was loaded is
+    newer and must survive until the next flush.
+    """
+    with _dirty_guard:
+        for key in [k for k, v in _dirty_state.items() if k in st and st[k] == v]:
+            del _dirty_state[key]
+
+
+def flush_state(force: bool = False) -> bool:
+    """Write staged fields if STATE_FLUSH_INTERVAL_SEC has passed (or force). Returns True if written."""
+    global _last_flush
+    now = time.monotonic()
+    with _dirty_guard:
+        if not _dirty_state or (not force and now - _last_flush < STATE_FLUSH_INTERVAL_SEC):
+            return False
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
+    try:
+        _save_state_unlocked(_load_state_unlocked(), _validated=True)
+    finally:
+        release_file_lock(_CFG.lock_path_str, lock_fd)
+    _last_flush = now
+    return True
+
+
+def checkpoint_now() -> None:
+    """Flush staged fields and fold the delta log into state.json (shutdown, before long operations).
+
+    Runs at exit so no deltas outlive the process: a rollback to -stable code
+    ignores state.delta.jsonl, and newer code would later replay those stale
+    entries over state.json.
+    """
+    try:
+        flush_state(force=True)
+        if _CFG.delta_path.exists() and _CFG.delta_path.stat().st_size:
+            compact_state()
+    except Exception:
+        log.warning("Failed to checkpoint state", exc_info=True)
+
+
+atexit.register(checkpoint_now)
+
+
+# ---------------------------------------------------------------------------
+# Delta log (single-key updates without rewriting state.json)
+# ---------------------------------------------------------------------------
+STATE_DELTA_COMPACT_EVERY: int = 200
+STATE_DELTA_MAX_BYTES: int = 64 * 1024
+_delta_appends_since_compact: int = 0
+
+
+def _delta_base_id() -> Optional[list]:
+    """Identify the state.json deltas apply to: [inode, mtime_ns, size], or None if missing.
+
+    Every rewrite of state.json (ours, or -stable code that ignores the delta
+    log) changes this, so deltas appended against an older file are skipped.
+    """
+    try:
+        st = os.stat(_CFG.state_path_str)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def append_delta(key: str, value: Any) -> int:
+    """Append one {"k", "v", "b", "ts"} patch to the delta log. Caller must hold STATE_LOCK.
+
+    "b" is the _delta_base_id() of the state.json the patch applies to.
+    Returns the log size in bytes after the append.
+    """
+    _CFG.delta_path.parent.mkdir(parents=True, exist_ok=True)
+    line = json_dumps_bytes({
+        "k": key, "v": value, "b": _delta_base_id(),
+        "ts": _now_iso(),
+    }, newline=True)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (_O_DSYNC if _DURABLE else 0)
+    fd = os.open(_CFG.delta_path_str, flags, 0o644)
+    try:
+        os.write(fd, line)
+        if _DURABLE and not _O_DSYNC:
+            _fsync(fd)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def _replay_state_deltas(st: Dict[str, Any]) -> bool:
+    """Apply delta log entries to st in order (later entries win). Returns True if any applied.
+
+    Entries written against a different state.json than the current one are stale
+    (state.json was rewritten without folding them in) and are skipped.
+    """
+    try:
+        raw = _CFG.delta_path.read_bytes()
+    except FileNotFoundError:
+        return False
+    except Exception:
+        log.warning("Failed to read state delta log %s", _CFG.delta_path, exc_info=True)
+        return False
+    if not raw:
+        return False
+    base = _delta_base_id()
+    applied = False
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json_loads(line)
+            if entry.get("b") != base:
+                continue
+            st[str(entry["k"])] = entry.get("v")
+            applied = True
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # A torn trailing line from a crash mid-append is expected; skip it.
+            log.debug("Skipping malformed state delta line: %r", line[:200])
+    return applied
+
+
+def _truncate_state_deltas() -> None:
+    """Drop delta entries once a full save has folded them into state.json."""
+    global _delta_appends_since_compact
+    _delta_appends_since_compact = 0
+    # Always stat: other processes append to the same log under the lock.
+    try:
+        if _CFG.delta_path.stat().st_size != 0:
+            os.truncate(_CFG.delta_path_str, 0)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        log.warning("Failed to truncate state delta log %s", _CFG.delta_path, exc_info=True)
+
+
+def compact_state() -> None:
+    """Fold the delta log into state.json and truncate it."""
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
+    try:
+        _save_state_unlocked(_load_state_unlocked(), _validated=True)
+    finally:
+        release_file_lock(_CFG.lock_path_str, lock_fd)
+
+
+def mutate(key: str, value: Any) -> None:
+    """Persist a single top-level key via the delta log instead of a full save_state.
+
+    Meant for hot counters such as tg_offset. The log is compacted into
+    state.json every STATE_DELTA_COMPACT_EVERY appends or once it exceeds
+    STATE_DELTA_MAX_BYTES. Readers that go through load_state see the new
+    value immediately; direct readers of state.json see it after compaction.
+    The log is also compacted on clean shutdown by checkpoint_now().
+    """
+    global _delta_appends_since_compact
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
+    try:
+        size = append_delta(key, value)
+        _delta_appends_since_compact += 1
+        if size > STATE_DELTA_MAX_BYTES or _delta_appends_since_compact >= STATE_DELTA_COMPACT_EVERY:
+            _save_state_unlocked(_load_state_unlocked(), _validated=True)
+    finally:
+        release_file_lock(_CFG.lock_path_str, lock_fd)
 
 
 def init_state() -> Dict[str, Any]:
@@ -211,7 +600,7 @@ def init_state() -> Dict[str, Any]:
     Fetches OpenRouter ground truth and stores session_daily_snapshot and
     session_spent_snapshot for drift calculation.
     """
-    lock_fd = acquire_file_lock(STATE_LOCK_PATH)
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
     try:
         st = _load_state_unlocked()
 
@@ -224,7 +613,7 @@ def init_state() -> Dict[str, Any]:
             st["session_total_snapshot"] = ground_truth["total_usd"]
             st["openrouter_total_usd"] = ground_truth["total_usd"]
             st["openrouter_daily_usd"] = ground_truth["daily_usd"]
-            st["openrouter_last_check_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            st["openrouter_last_check_at"] = _now_iso()
         else:
             # If we can't fetch ground truth, use 0 as baseline
             st["session_total_snapshot"] = 0.0
@@ -236,7 +625,7 @@ def init_state() -> Dict[str, Any]:
         _save_state_unlocked(st)
         return st
     finally:
-        release_file_lock(STATE_LOCK_PATH, lock_fd)
+        release_file_lock(_CFG.lock_path_str, lock_fd)
 
 
 # ---------------------------------------------------------------------------
@@ -322,7 +711,7 @@ def update_budget_from_usage(usage: Dict[str, Any]) -> None:
             return default
 
     # Step 1: Update budget counters under lock (fast, no I/O beyond Drive)
-    lock_fd = acquire_file_lock(STATE_LOCK_PATH)
+    lock_fd = acquire_file_lock(_CFG.lock_path_str)
     try:
         st = _load_state_unlocked()
         cost = usage.get("cost") if isinstance(usage, dict) else None
@@ -340,18 +729,18 @@ def update_budget_from_usage(usage: Dict[str, Any]) -> None:
         should_check_ground_truth = (st["spent_calls"] % 50 == 0)
         _save_state_unlocked(st)
     finally:
-        release_file_lock(STATE_LOCK_PATH, lock_fd)
+        release_file_lock(_CFG.lock_path_str, lock_fd)
 
     # Step 2: HTTP to OpenRouter OUTSIDE the lock (can take up to 10s)
     if should_check_ground_truth:
         ground_truth = check_openrouter_ground_truth()
         if ground_truth is not None:
-            lock_fd = acquire_file_lock(STATE_LOCK_PATH)
+            lock_fd = acquire_file_lock(_CFG.lock_path_str)
             try:
                 st = _load_state_unlocked()
                 st["openrouter_total_usd"] = ground_truth["total_usd"]
                 st["openrouter_daily_usd"] = ground_truth["daily_usd"]
-                st["openrouter_last_check_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                st["openrouter_last_check_at"] = _now_iso()
 
                 session_total_snap = st.get("session_total_snapshot")
                 session_spent_snap = st.get("session_spent_snapshot")
@@ -369,9 +758,9 @@ def update_budget_from_usage(usage: Dict[str, Any]) -> None:
                         if drift_pct > 50.0 and abs_diff > 5.0:
                             st["budget_drift_alert"] = True
                             append_jsonl(
-                                DRIVE_ROOT / "logs" / "events.jsonl",
+                                _CFG.drive_root / "logs" / "events.jsonl",
                                 {
-                                    "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                                    "ts": _now_iso(),
                                     "event": "budget_drift_warning",
                                     "drift_pct": round(drift_pct, 2),
                                     "our_delta": round(our_delta, 4),
@@ -389,157 +778,7 @@ def update_budget_from_usage(usage: Dict[str, Any]) -> None:
 
                 _save_state_unlocked(st)
             finally:
-                release_file_lock(STATE_LOCK_PATH, lock_fd)
-
-
-# ---------------------------------------------------------------------------
-# Budget breakdown by category
-# ---------------------------------------------------------------------------
-
-def budget_breakdown(st: Dict[str, Any]) -> Dict[str, float]:
-    """
-    Calculate budget breakdown by category from events.jsonl.
-
-    Reads llm_usage events and aggregates cost_usd by category field.
-    Returns dict like {"task": 12.5, "evolution": 45.2, ...}
-    """
-    events_path = DRIVE_ROOT / "logs" / "events.jsonl"
-    if not events_path.exists():
-        return {}
-
-    breakdown: Dict[str, float] = {}
-    try:
-        with events_path.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    event = json.loads(line)
-                    if event.get("type") != "llm_usage":
-                        continue
-
-                    # Get category (default to "other" if not present)
-                    category = event.get("category", "other")
-
-                    # Get cost from either top-level "cost" or nested "usage.cost"
-                    cost = 0.0
-                    if "cost" in event:
-                        cost = float(event.get("cost", 0))
-                    elif "usage" in event and isinstance(event["usage"], dict):
-                        cost = float(event["usage"].get("cost", 0))
-
-                    if cost > 0:
-                        breakdown[category] = breakdown.get(category, 0.0) + cost
-
-                except (json.JSONDecodeError, ValueError, TypeError):
-                    continue
-    except Exception:
-        log.warning("Failed to calculate budget breakdown", exc_info=True)
-
-    return breakdown
-
-
-def model_breakdown(st: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
-    """
-    Calculate budget breakdown by model from events.jsonl.
-
-    Returns dict like:
-    {
-        "anthropic/claude-sonnet-4.6": {"cost": 12.5, "calls": 120, "prompt_tokens": 50000, "completion_tokens": 3000},
-        "openai/gpt-4o": {"cost": 3.2, "calls": 15, ...},
-    }
-    """
-    events_path = DRIVE_ROOT / "logs" / "events.jsonl"
-    if not events_path.exists():
-        return {}
-
-    breakdown: Dict[str, Dict[str, float]] = {}
-    try:
-        with events_path.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    event = json.loads(line)
-                    if event.get("type") != "llm_usage":
-                        continue
-
-                    model = event.get("model") or "unknown"
-                    if not model:
-                        model = "unknown"
-
-                    # Get cost
-                    cost = 0.0
-                    if "cost" in event:
-                        cost = float(event.get("cost", 0))
-                    elif "usage" in event and isinstance(event["usage"], dict):
-                        cost = float(event["usage"].get("cost", 0))
-
-                    # Get tokens
-                    prompt_tokens = int(event.get("prompt_tokens", 0) or 0)
-                    completion_tokens = int(event.get("completion_tokens", 0) or 0)
-                    cached_tokens = int(event.get("cached_tokens", 0) or 0)
-
-                    if model not in breakdown:
-                        breakdown[model] = {"cost": 0.0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
-
-                    breakdown[model]["cost"] += cost
-                    breakdown[model]["calls"] += 1
-                    breakdown[model]["prompt_tokens"] += prompt_tokens
-                    breakdown[model]["completion_tokens"] += completion_tokens
-                    breakdown[model]["cached_tokens"] += cached_tokens
-
-                except (json.JSONDecodeError, ValueError, TypeError):
-                    continue
-    except Exception:
-        log.warning("Failed to calculate model breakdown", exc_info=True)
-
-    return breakdown
-
-
-def per_task_cost_summary(max_tasks: int = 10, tail_bytes: int = 512_000) -> List[Dict[str, Any]]:
-    """Return cost summary for recent tasks from events.jsonl.
-
-    Only reads the last `tail_bytes` of the file to avoid scanning
-    megabytes of history on every LLM round.
-
-    Returns list of dicts: [{task_id, cost, rounds, model}, ...]
-    sorted by cost descending, limited to max_tasks.
-    """
-    events_path = DRIVE_ROOT / "logs" / "events.jsonl"
-    if not events_path.exists():
-        return []
-
-    tasks: Dict[str, Dict[str, Any]] = {}
-    try:
-        file_size = events_path.stat().st_size
-        with events_path.open("r", encoding="utf-8") as f:
-            if file_size > tail_bytes:
-                f.seek(file_size - tail_bytes)
-                f.readline()  # skip partial first line
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    event = json.loads(line)
-                    if event.get("type") != "llm_usage":
-                        continue
-                    tid = event.get("task_id") or "unknown"
-                    cost = float(event.get("cost", 0) or 0)
-                    if tid not in tasks:
-                        tasks[tid] = {"task_id": tid, "cost": 0.0, "rounds": 0, "model": event.get("model", "")}
-                    tasks[tid]["cost"] += cost
-                    tasks[tid]["rounds"] += 1
-                except (json.JSONDecodeError, ValueError, TypeError):
-                    continue
-    except Exception:
-        log.warning("Failed to calculate per-task cost summary", exc_info=True)
-
-    sorted_tasks = sorted(tasks.values(), key=lambda x: x["cost"], reverse=True)
-    return sorted_tasks[:max_tasks]
+                release_file_lock(_CFG.lock_path_str, lock_fd)
 
 
 # ---------------------------------------------------------------------------
@@ -600,7 +839,7 @@ def status_text(workers_dict: Dict[int, Any], pending_list: list, running_dict:
     lines.append(f"prompt_tokens: {st.get('spent_tokens_prompt')}, completion_tokens: {st.get('spent_tokens_completion')}, cached_tokens: {st.get('spent_tokens_cached')}")
 
     # Add budget breakdown by category
-    breakdown = budget_breakdown(st)
+    breakdown = budget_breakdown(_CFG.drive_root / "logs" / "events.jsonl")
     if breakdown:
         # Sort by cost descending
         sorted_categories = sorted(breakdown.items(), key=lambda x: x[1], reverse=True)
@@ -626,7 +865,7 @@ def status_text(workers_dict: Dict[int, Any], pending_list: list, running_dict:
             )
 
     # Model breakdown
-    models = model_breakdown(st)
+    models = model_breakdown(_CFG.drive_root / "logs" / "events.jsonl")
     if models:
         sorted_models = sorted(models.items(), key=lambda x: x[1]["cost"], reverse=True)
         lines.append("model_breakdown:")
@@ -47,6 +47,8 @@ TOOL_MODULES = [
 
 SUPERVISOR_MODULES = [
     "supervisor.state",
+    "supervisor.locks",
+    "supervisor.costs",
     "supervisor.telegram",
     "supervisor.queue",
     "supervisor.workers",
@@ -193,6 +195,32 @@ def test_estimate_tokens():
     assert 5 <= tokens <= 20
 
 
+def test_append_jsonl_reuses_handle_and_survives_unlink():
+    """append_jsonl keeps writing correctly across calls and after the file is removed."""
+    import json
+    from ouroboros.utils import append_jsonl
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "logs" / "events.jsonl"
+        append_jsonl(path, {"n": 1})
+        append_jsonl(path, {"n": 2})
+        assert [json.loads(line)["n"] for line in path.read_text(encoding="utf-8").splitlines()] == [1, 2]
+        path.unlink()
+        append_jsonl(path, {"n": 3})
+        assert [json.loads(line)["n"] for line in path.read_text(encoding="utf-8").splitlines()] == [3]
+
+
+def test_jsonl_line_matches_stdlib(monkeypatch):
+    """The orjson and stdlib encoders produce equivalent JSONL lines."""
+    import json
+    import ouroboros.utils as utils
+    obj = {"ts": "2026-01-01T00:00:00+00:00", "text": "привет", "n": 1.5, "none": None}
+    fast = utils._jsonl_line(obj)
+    monkeypatch.setattr(utils, "orjson", None)
+    slow = utils._jsonl_line(obj)
+    assert fast.endswith(b"\n") and slow.endswith(b"\n")
+    assert json.loads(fast) == json.loads(slow) == obj
+
+
 # ── Memory ───────────────────────────────────────────────────────
 
 def test_memory_scratchpad():
@@ -0,0 +1,370 @@
+"""Tests for supervisor state persistence.
+
+Run: python -m pytest tests/test_state.py -v
+"""
+import json
+import pathlib
+
+import pytest
+
+
+@pytest.fixture
+def state(tmp_path):
+    import supervisor.state as st_mod
+    st_mod.init(tmp_path)
+    yield st_mod
+    st_mod._dirty_state.clear()
+
+
+def test_init_builds_frozen_config(state, tmp_path):
+    """init() installs one immutable StateConfig with pre-built str paths."""
+    import dataclasses
+    cfg = state.get_config()
+    assert cfg.state_path == tmp_path / "state" / "state.json"
+    assert cfg.state_path_str == str(cfg.state_path)
+    assert cfg.lock_path_str == str(cfg.lock_path)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        cfg.state_path = tmp_path
+
+
+def test_save_load_roundtrip(state):
+    """Saved state is read back unchanged."""
+    st = state.load_state()
+    st["tg_offset"] = 42
+    state.save_state(st)
+    assert state.load_state()["tg_offset"] == 42
+
+
+def test_save_mirrors_last_good(state):
+    """save_state keeps state.last_good.json in sync with state.json."""
+    st = state.load_state()
+    st["evolution_cycle"] = 7
+    state.save_state(st)
+    primary = json.loads(state._CFG.state_path.read_text(encoding="utf-8"))
+    mirror = json.loads(state._CFG.last_good_path.read_text(encoding="utf-8"))
+    assert primary == mirror
+    assert mirror["evolution_cycle"] == 7
+
+
+def test_load_recovers_from_last_good(state):
+    """Corrupt state.json falls back to the last good mirror."""
+    st = state.load_state()
+    st["spent_calls"] = 5
+    state.save_state(st)
+    state._CFG.state_path.write_text("{not json", encoding="utf-8")
+    assert state.load_state()["spent_calls"] == 5
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["spent_calls"] == 5
+
+
+def test_save_leaves_no_temp_files(state):
+    """Atomic writes clean up their temp files."""
+    state.save_state(state.load_state())
+    leftovers = [p.name for p in pathlib.Path(state._CFG.state_path.parent).iterdir() if ".tmp." in p.name]
+    assert leftovers == []
+
+
+def test_load_migrates_legacy_state(state):
+    """A state file without the schema marker is migrated and persisted once."""
+    state._CFG.state_path.parent.mkdir(parents=True, exist_ok=True)
+    state._CFG.state_path.write_text(json.dumps({"tg_offset": 3, "approvals": []}), encoding="utf-8")
+    st = state.load_state()
+    assert st["tg_offset"] == 3
+    assert "approvals" not in st
+    stored = json.loads(state._CFG.state_path.read_text(encoding="utf-8"))
+    assert stored["__schema_v"] == state._STATE_SCHEMA_VERSION
+    assert "spent_usd" in stored
+
+
+def test_load_accepts_stdlib_nan(state):
+    """State written by stdlib json with NaN still loads instead of resetting to defaults."""
+    legacy = '{"owner_id": 7, "spent_usd": 50, "budget_drift_pct": NaN, "pad": "%s"}' % ("x" * 5000)
+    state._CFG.state_path.parent.mkdir(parents=True, exist_ok=True)
+    state._CFG.state_path.write_text(legacy, encoding="utf-8")
+    st = state.load_state()
+    assert (st["owner_id"], st["spent_usd"]) == (7, 50)
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["spent_usd"] == 50
+
+
+def test_mutate_appends_delta_and_replays(state):
+    """mutate() goes to the delta log and load_state replays it."""
+    state.save_state(state.load_state())
+    state.mutate("tg_offset", 11)
+    state.mutate("tg_offset", 12)
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["tg_offset"] == 0
+    assert len(state._CFG.delta_path.read_text(encoding="utf-8").splitlines()) == 2
+    assert state.load_state()["tg_offset"] == 12
+
+
+def test_delta_replay_skips_entries_for_replaced_state(state):
+    """Deltas left behind when other code rewrote state.json are not replayed over it."""
+    import os
+    state.save_state(state.load_state())
+    state.mutate("tg_offset", 5)
+    newer = json.loads(state._CFG.state_path.read_text(encoding="utf-8"))
+    newer["tg_offset"] = 9
+    tmp = state._CFG.state_path.with_name("rollback.tmp")
+    tmp.write_text(json.dumps(newer), encoding="utf-8")
+    os.replace(tmp, state._CFG.state_path)
+    assert state.load_state()["tg_offset"] == 9
+
+
+def test_full_save_compacts_delta_log(state):
+    """A full save folds pending deltas into state.json and empties the log."""
+    state.mutate("tg_offset", 99)
+    state.compact_state()
+    assert state._CFG.delta_path.stat().st_size == 0
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["tg_offset"] == 99
+    assert state.load_state()["tg_offset"] == 99
+
+
+def test_checkpoint_compacts_delta_log(state):
+    """The exit checkpoint folds pending deltas into state.json."""
+    state.save_state(state.load_state())
+    state.mutate("tg_offset", 21)
+    state.checkpoint_now()
+    assert state._CFG.delta_path.stat().st_size == 0
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["tg_offset"] == 21
+
+
+def test_delta_replay_skips_torn_line(state):
+    """A partial trailing delta line (crash mid-append) is ignored."""
+    state.mutate("tg_offset", 5)
+    with state._CFG.delta_path.open("a", encoding="utf-8") as f:
+        f.write('{"k": "tg_offset", "v": 6')
+    assert state.load_state()["tg_offset"] == 5
+
+
+def test_roundtrip_without_orjson(state, monkeypatch):
+    """State persistence works on the stdlib json fallback."""
+    import ouroboros.utils as utils
+    monkeypatch.setattr(state, "orjson", None)
+    monkeypatch.setattr(utils, "orjson", None)
+    st = state.load_state()
+    st["owner_id"] = 123
+    state.save_state(st)
+    state.mutate("tg_offset", 4)
+    loaded = state.load_state()
+    assert loaded["owner_id"] == 123
+    assert loaded["tg_offset"] == 4
+
+
+def test_file_lock_excludes_other_threads(state, tmp_path):
+    """A held lock blocks other threads in the same process until released."""
+    import threading
+    lock_path = tmp_path / "locks" / "t.lock"
+    fd = state.acquire_file_lock(lock_path)
+    assert fd is not None
+    result = {}
+    t = threading.Thread(target=lambda: result.update(fd=state.acquire_file_lock(lock_path, timeout_sec=0.1)))
+    t.start()
+    t.join()
+    assert result["fd"] is None
+    state.release_file_lock(lock_path, fd)
+    assert lock_path.with_suffix(".flock").exists(), "flock file is persistent, not unlinked on release"
+    assert not lock_path.exists(), "the O_EXCL lock name stays free for older code"
+    fd2 = state.acquire_file_lock(lock_path, timeout_sec=0.1)
+    assert fd2 is not None
+    state.release_file_lock(lock_path, fd2)
+
+
+def test_file_lock_excludes_other_processes(state, tmp_path):
+    """A held lock blocks a separate process."""
+    import subprocess
+    import sys
+    lock_path = tmp_path / "locks" / "p.lock"
+    fd = state.acquire_file_lock(lock_path)
+    try:
+        code = (
+            "import pathlib, supervisor.state as s; "
+            f"print(s.acquire_file_lock(pathlib.Path({str(lock_path)!r}), timeout_sec=0.1))"
+        )
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=str(pathlib.Path(__file__).resolve().parent.parent))
+        assert out.stdout.strip() == "None"
+    finally:
+        state.release_file_lock(lock_path, fd)
+
+
+def test_full_save_truncates_deltas_from_other_processes(state, tmp_path):
+    """A full save drops deltas another process appended after our last truncate."""
+    import subprocess
+    import sys
+    state.save_state(state.load_state())
+    code = (
+        "import pathlib, supervisor.state as s; "
+        f"s.init(pathlib.Path({str(tmp_path)!r})); s.mutate('tg_offset', 6)"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   cwd=str(pathlib.Path(__file__).resolve().parent.parent))
+    state.update_state(tg_offset=7)
+    assert state._CFG.delta_path.stat().st_size == 0
+    assert state.load_state()["tg_offset"] == 7
+
+
+def test_shared_lock_allows_readers_blocks_writer(state, tmp_path):
+    """Shared holders coexist; an exclusive request waits for all of them."""
+    import threading
+    lock_path = tmp_path / "locks" / "rw.lock"
+    r1 = state.acquire_file_lock_shared(lock_path)
+    result = {}
+    t = threading.Thread(target=lambda: result.update(
+        r2=state.acquire_file_lock_shared(lock_path, timeout_sec=0.1),
+        w=state.acquire_file_lock(lock_path, timeout_sec=0.1),
+    ))
+    t.start()
+    t.join()
+    assert r1 is not None and result["r2"] is not None
+    assert result["w"] is None
+    state.release_file_lock(lock_path, result["r2"])
+    state.release_file_lock(lock_path, r1)
+    w = state.acquire_file_lock(lock_path, timeout_sec=0.1)
+    assert w is not None
+    assert state.acquire_file_lock_shared(lock_path, timeout_sec=0.05) is None
+    state.release_file_lock(lock_path, w)
+
+
+def test_mark_dirty_is_visible_before_flush(state):
+    """Staged fields are served by load_state before they hit disk."""
+    state.save_state(state.load_state())
+    state.mark_dirty("last_owner_message_at", "2026-01-01T00:00:00+00:00")
+    assert state.load_state()["last_owner_message_at"] == "2026-01-01T00:00:00+00:00"
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["last_owner_message_at"] == ""
+    assert state.flush_state(force=True)
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["last_owner_message_at"] == "2026-01-01T00:00:00+00:00"
+    assert not state.flush_state(force=True), "nothing left to flush"
+
+
+def test_flush_does_not_clobber_other_writes(state):
+    """Flushing staged fields keeps values other code saved in the meantime."""
+    state.mark_dirty("last_owner_message_at", "x")
+    st = state.load_state()
+    st["spent_calls"] = 17
+    state.save_state(st)
+    state.flush_state(force=True)
+    stored = json.loads(state._CFG.state_path.read_text(encoding="utf-8"))
+    assert stored["spent_calls"] == 17
+    assert stored["last_owner_message_at"] == "x"
+
+
+def test_unchanged_save_skips_write(state):
+    """Saving a state identical to what is on disk does not rewrite the file."""
+    st = state.load_state()
+    state.save_state(st)
+    before = state._CFG.state_path.stat()
+    state.save_state(state.load_state())
+    after = state._CFG.state_path.stat()
+    assert (before.st_ino, before.st_mtime_ns) == (after.st_ino, after.st_mtime_ns)
+
+
+def test_unchanged_save_rewrites_after_external_edit(state):
+    """The skip is based on what was last read from disk, not only on our own writes."""
+    st = state.load_state()
+    state.save_state(st)
+    state._CFG.state_path.write_text(json.dumps({**st, "tg_offset": 77}), encoding="utf-8")
+    reloaded = state.load_state()
+    reloaded["tg_offset"] = st["tg_offset"]
+    state.save_state(reloaded)
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["tg_offset"] == st["tg_offset"]
+
+
+def test_update_state_patches_several_keys(state):
+    """update_state sets all given keys in one save and keeps the rest."""
+    st = state.load_state()
+    st["spent_calls"] = 3
+    state.save_state(st)
+    state.update_state(current_branch="ouroboros", current_sha="abc123")
+    stored = json.loads(state._CFG.state_path.read_text(encoding="utf-8"))
+    assert (stored["current_branch"], stored["current_sha"]) == ("ouroboros", "abc123")
+    assert stored["spent_calls"] == 3
+
+
+def test_transaction_discards_changes_on_error(state):
+    """A transaction that raises writes nothing and releases the lock."""
+    with state.transaction() as st:
+        st["evolution_cycle"] = 1
+    with pytest.raises(RuntimeError):
+        with state.transaction() as st:
+            st["evolution_cycle"] = 2
+            raise RuntimeError("boom")
+    assert state.load_state()["evolution_cycle"] == 1
+    fd = state.acquire_file_lock(state._CFG.lock_path_str, timeout_sec=0.1)
+    assert fd is not None
+    state.release_file_lock(state._CFG.lock_path_str, fd)
+
+
+def test_large_state_loads_via_mmap(state):
+    """States past the mmap threshold load and keep the unchanged-save skip."""
+    st = state.load_state()
+    st["budget_breakdown_cache"] = {f"k{i}": "x" * 32 for i in range(200)}
+    state.save_state(st)
+    assert state._CFG.state_path.stat().st_size >= state._MMAP_MIN_BYTES
+    assert state.load_state()["budget_breakdown_cache"] == st["budget_breakdown_cache"]
+    before = state._CFG.state_path.stat().st_mtime_ns
+    state.save_state(state.load_state())
+    assert state._CFG.state_path.stat().st_mtime_ns == before
+
+
+def test_large_state_loads_when_mmap_fails(state, monkeypatch):
+    """A mount that refuses mmap falls back to a plain read instead of resetting state."""
+    st = state.load_state()
+    st["spent_usd"] = 123.0
+    st["budget_breakdown_cache"] = {f"k{i}": "x" * 32 for i in range(200)}
+    state.save_state(st)
+
+    def _no_mmap(*args, **kwargs):
+        raise OSError(19, "No such device")
+
+    monkeypatch.setattr(state.mmap, "mmap", _no_mmap)
+    assert state.load_state()["spent_usd"] == 123.0
+    assert json.loads(state._CFG.state_path.read_text(encoding="utf-8"))["spent_usd"] == 123.0
+
+
+@pytest.fixture
+def queue(state, monkeypatch):
+    import supervisor.queue as q_mod
+    monkeypatch.setattr(q_mod, "_snapshot_base", None)
+    monkeypatch.setattr(q_mod, "_snapshot_patches", 0)
+    monkeypatch.setattr(q_mod, "PENDING", [])
+    monkeypatch.setattr(q_mod, "RUNNING", {})
+    return q_mod
+
+
+def test_queue_snapshot_appends_patches_and_replays(queue):
+    """Only the first save writes the full snapshot; later saves are patches that load replays."""
+    queue.enqueue_task({"id": "a", "type": "task", "chat_id": 1, "text": "one"})
+    queue.persist_queue_snapshot(reason="first")
+    base = queue.get_config().queue_snapshot_path.read_bytes()
+    queue.enqueue_task({"id": "b", "type": "task", "chat_id": 1, "text": "two"})
+    queue.persist_queue_snapshot(reason="second")
+    queue.PENDING.pop(0)
+    queue.persist_queue_snapshot(reason="third")
+    assert queue.get_config().queue_snapshot_path.read_bytes() == base
+    assert len(queue.get_config().queue_snapshot_patch_path.read_text(encoding="utf-8").splitlines()) == 2
+    snap = queue.load_queue_snapshot()
+    assert [r["id"] for r in snap["pending"]] == ["b"]
+    assert (snap["reason"], snap["pending_count"]) == ("third", 1)
+
+
+def test_queue_snapshot_patch_skips_unchanged_running_rows(queue):
+    """A running task whose metadata did not change is not re-sent on every tick."""
+    queue.RUNNING["r1"] = {"task": {"id": "r1", "type": "task", "text": "x" * 2000},
+                           "started_at": 1.0, "last_heartbeat_at": 2.0, "attempt": 1, "worker_id": 0}
+    queue.persist_queue_snapshot(reason="tick")
+    queue.persist_queue_snapshot(reason="tick")
+    patch = json.loads(queue.get_config().queue_snapshot_patch_path.read_text(encoding="utf-8"))
+    assert "running" not in patch
+    assert queue.load_queue_snapshot()["running"][0]["started_at"] == 1.0
+
+
+def test_queue_snapshot_compacts_and_ignores_stale_patches(queue, monkeypatch):
+    """Every K patches the full snapshot is rewritten and the patch log restarts."""
+    monkeypatch.setattr(queue, "QUEUE_SNAPSHOT_COMPACT_EVERY", 2)
+    for i in range(4):
+        queue.enqueue_task({"id": f"t{i}", "type": "task", "chat_id": 1, "text": str(i)})
+        queue.persist_queue_snapshot(reason=f"r{i}")
+    stored = json.loads(queue.get_config().queue_snapshot_path.read_text(encoding="utf-8"))
+    assert [r["id"] for r in stored["pending"]] == ["t0", "t1", "t2", "t3"]
+    assert queue.get_config().queue_snapshot_patch_path.stat().st_size == 0
+    with queue.get_config().queue_snapshot_patch_path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"gen": "stale", "set": {"reason": "old"}}) + "\n")
+    assert queue.load_queue_snapshot()["reason"] == "r3"